@@ -1,6 +1,4 @@
-import re
 from itertools import chain
-from collections import Counter, defaultdict
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -30,6 +28,50 @@ def grid_values(grid):
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
 
+def grid_board(grid):
+    """
+    Convert grid into a board of candidate bitmasks.
+    Args:
+        grid(string) - A grid in string form.
+    Returns:
+        A list of 81 ints, one per box in the order of `boxes`. Bit d-1 is set when d is a candidate,
+        so a box with no value is 0x1FF and a box with the value '8' is 0x80.
+    """
+    return [all_digits if val == '.' else digit_bits[val] for val in grid]
+
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+
+def values_to_board(values):
+    """
+    Convert a sudoku dictionary into a board of candidate bitmasks.
+    Input: A sudoku dictionary.
+    Output: A board, i.e., a list of 81 bitmasks.
+    """
+    # values are normally in sorted order, so they can be looked up directly; anything else is added up digit by digit
+    return [digits_mask.get(values[box]) or sum(digit_bits[digit] for digit in values[box]) for box in boxes]
+
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+
+def board_to_values(board, values=None):
+    """
+    Convert a board of candidate bitmasks back into a sudoku dictionary.
+    Input: A board, and optionally a sudoku dictionary to update in place.
+    Output: A sudoku dictionary.
+    """
+    if values is None:
+        values = {}
+    for box, mask in zip(boxes, board):
+        values[box] = mask_digits[mask]
+    return values
+
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+
 def display(values):
     """
     Display the values as a 2-D grid.
@@ -53,17 +95,44 @@ def eliminate(values):
     """
     Go through all the boxes, and whenever there is a box with a value, eliminate this value from the values of all its peers.
     Input: A sudoku in dictionary form.
-    Output: The resulting sudoku in dictionary form.
+    Output: The resulting sudoku in dictionary form, or False if the sudoku can't be solved.
+    """
+    board = eliminate_board(values_to_board(values))
+    return board_to_values(board, values) if board else False
+
+def eliminate_board(board, solved=None, dirty=None):
     """
-    # finds all boxes with only one value
+    Same as eliminate, but works on a board of bitmasks.
+    Input: A board, optionally a list of newly solved boxes that still have to be eliminated from their peers,
+        and optionally a set that the indexes of the changed units are added to. Without a list, this makes a single
+        sweep over the boxes that are solved to begin with, like eliminate.
+    Output: The resulting board, or False if a box is left with no values. On success the list of newly solved
+        boxes is left empty.
+    """
+    # takes the boxes with only one value off the list, one at a time
     # then finds the peer boxes for each solved box
     # if a peer box contains the same number as the solved box, then that number gets removed
-    solved_boxes = [box for box in boxes if len(values[box]) == 1]
-    for box in solved_boxes:
-        digit = values[box]
-        for peer in peers[box]:
-            values[peer] = values[peer].replace(digit,'')
-    return values
+    # if that leaves the peer box with only one value, and a list was passed in, then it goes on the list as well
+    # if it leaves the peer box with no values at all, the board can't be solved, so stop right away
+    propagate = solved is not None
+    if solved is None:
+        solved = find_solved_boxes(board)
+    while solved:
+        i = solved.pop()
+        mask = board[i]
+        keep = ~mask
+        for peer in peer_idx[i]:
+            value = board[peer]
+            if value & mask:
+                value &= keep
+                if not value:
+                    return False
+                board[peer] = value
+                if propagate and mask_len[value] == 1:
+                    solved.append(peer)
+                if dirty is not None:
+                    dirty.update(box_units[peer])
+    return board
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -73,18 +142,59 @@ def only_choice(values):
     """
     Go through all the units, and whenever there is a unit with a value that only fits in one box, assign the value to this box.
     Input: A sudoku in dictionary form.
-    Output: The resulting sudoku in dictionary form.
-    """
-    # iterate though each unit
-    # inside each unit, iterate through the numbers 1 to 9
-    # then, for example, look for the number "3" in each box in a particular unit
-    # if only one box in a unit has a "3", then mark that box as "3"
-    for unit in units:
-        for digit in '123456789':
-            dplaces = [box for box in unit if digit in values[box]]
-            if len(dplaces) == 1:
-                values[dplaces[0]] = digit
-    return values
+    Output: The resulting sudoku in dictionary form, or False if the sudoku can't be solved.
+    """
+    board = only_choice_board(values_to_board(values))
+    return board_to_values(board, values) if board else False
+
+def only_choice_board(board, solved=None, visit=None, dirty=None):
+    """
+    Same as only_choice, but works on a board of bitmasks.
+    Input: A board, optionally a list that newly solved boxes are added to, optionally the indexes of the
+        units to look at (all of them by default), and optionally a set that the indexes of the changed units are added to.
+    Output: The resulting board, or False if a unit has a number with no place to go, or two numbers with only one.
+    """
+    # iterate though each unit, counting all nine numbers at once using bitmasks
+    # `once` has the bits of the numbers seen in at least one box, `twice` the numbers seen in two or more
+    # so `once & ~twice` has the numbers, for example "3", that only one box in the unit has
+    # numbers in `placed` already belong to a solved box, so there is nothing left to do for them
+    # then mark the box holding the rest of the numbers, like "3", as "3"
+    # if a number has no box at all in a unit, or two numbers need the same box, the board can't be solved
+    # without a dirty set, as from only_choice, the numbers are taken one at a time from "1" to "9", and the unit
+    # is counted again after each assignment, since that can leave another, higher number with only one box
+    # with a dirty set, every number is handled in one go, and the changed units get counted again on the next pass
+    for u in range(len(unit_idx)) if visit is None else visit:
+        unit = unit_idx[u]
+        rest = all_digits
+        while rest:
+            once = twice = placed = 0
+            for i in unit:
+                mask = board[i]
+                twice |= once & mask
+                once |= mask
+                if mask_len[mask] == 1:
+                    placed |= mask
+            if once != all_digits:
+                return False
+            only = once & ~twice & ~placed & rest
+            if not only: break
+            if dirty is None:
+                only &= -only
+                rest &= ~((only << 1) - 1)
+            else:
+                rest = 0
+            for i in unit:
+                bit = board[i] & only
+                if not bit: continue
+                if bit & (bit - 1):
+                    return False
+                if board[i] == bit: continue
+                board[i] = bit
+                if solved is not None:
+                    solved.append(i)
+                if dirty is not None:
+                    dirty.update(box_units[i])
+    return board
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -96,25 +206,51 @@ def naked_twins(values):
     Args:
         values(dict): a dictionary of the form {'box_name': '123456789', ...}
     Returns:
-        the values dictionary with the naked twins eliminated from peers.
-    """
-    # iterate through each unit, and then each box in that unit
-    # create a dictionary, and if the value in a box has 2 numbers, like "35" then add "35" to the dictionary with a value of 1
-    # increment this value, 1, if another "35" is found in the same unit
-    # iterate over the dictionary, finding all the two-lettered keys, i.e., "35" or "78" which have been seen only twice in a unit
-    # if another box in that unit contains the value, like "1357", then remove the "35", leaving only "17"
-    for unit in units:
-        d = defaultdict(int)
-        for box in unit:
-            val = values[box]
-            if len(val) == 2:
-                d[val] += 1
-        for (a, b), count in d.items():
+        the values dictionary with the naked twins eliminated from peers, or False if the sudoku can't be solved.
+    """
+    board = naked_twins_board(values_to_board(values))
+    return board_to_values(board, values) if board else False
+
+def naked_twins_board(board, solved=None, visit=None, dirty=None):
+    """
+    Same as naked_twins, but works on a board of bitmasks.
+    Input: A board, optionally a list that newly solved boxes are added to, optionally the indexes of the
+        units to look at (all of them by default), and optionally a set that the indexes of the changed units are added to.
+    Output: The resulting board, or False if a box is left with no values.
+    """
+    # iterate through each unit, and count the boxes holding exactly 2 values, like "35"
+    # the counts live in a list indexed by mask, and `pairs` remembers which masks were seen, so that
+    # only those entries have to be checked and reset before the next unit
+    # find all the two-value masks which have been seen only twice in a unit
+    # if another box in that unit contains the value, like "1357", then clear the "35" bits, leaving only "17"
+    # three boxes can't share two values, and a box can't be left empty, so in either case the board can't be solved
+    counts = [0] * (all_digits + 1)
+    for u in range(len(unit_idx)) if visit is None else visit:
+        unit = unit_idx[u]
+        pairs = []
+        for i in unit:
+            mask = board[i]
+            if mask_len[mask] == 2:
+                if not counts[mask]:
+                    pairs.append(mask)
+                counts[mask] += 1
+        for twins in pairs:
+            count = counts[twins]
+            counts[twins] = 0
+            if count > 2:
+                return False
             if count == 2:
-                for box in unit:
-                    if values[box] != a + b:
-                        values[box] = re.sub(a + '|' + b, '', values[box])
-    return values
+                keep = twin_keep[twins]
+                for i in unit:
+                    if board[i] != twins and board[i] & twins:
+                        board[i] &= keep
+                        if not board[i]:
+                            return False
+                        if solved is not None and mask_len[board[i]] == 1:
+                            solved.append(i)
+                        if dirty is not None:
+                            dirty.update(box_units[i])
+    return board
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -122,15 +258,47 @@ def naked_twins(values):
 
 def reduce_puzzle(values):
     """
-    Runs one pass over each of the three elimination techniques.
+    Runs the three elimination techniques over and over, until they stop removing values.
     Input: A sudoku dictionary
-    Output: A sudoku dictionary
+    Output: A sudoku dictionary, or False if the sudoku can't be solved.
     """
-    # run through each elimination strategy once
-    values = eliminate(values)
-    values = only_choice(values)
-    values = naked_twins(values)
-    return values
+    board = reduce_board(values_to_board(values))
+    return board_to_values(board, values) if board else False
+
+def reduce_board(board, solved=None, dirty=None):
+    """
+    Same as reduce_puzzle, but works on a board of bitmasks.
+    Input: A board, optionally a list of the boxes solved since the board was last reduced,
+        and optionally a set of the indexes of the units changed since then.
+    Output: The resulting board, or False as soon as one of the strategies finds the board can't be solved.
+    """
+    # run through each elimination strategy
+    # the strategies share a list of newly solved boxes, so eliminate only visits the boxes that changed
+    # they also share a set of "dirty" units that changed since only_choice last looked at them,
+    # and `twins_dirty` holds the units that changed since naked_twins last looked at them
+    # eliminate and only_choice are cheap, so they run back and forth until they stop changing anything,
+    # and only then does naked_twins get a turn
+    # once neither set has any units left, the board is as reduced as it will get
+    if solved is None:
+        solved = find_solved_boxes(board)
+    if dirty is None:
+        dirty = set(range(len(unit_idx)))
+    twins_dirty = set()
+    while board:
+        board = eliminate_board(board, solved, dirty)
+        if not board: break
+        if dirty:
+            visit = sorted(dirty)
+            twins_dirty.update(dirty)
+            dirty.clear()
+            board = only_choice_board(board, solved, visit, dirty)
+            continue
+        if not twins_dirty:
+            return board
+        visit = sorted(twins_dirty)
+        twins_dirty.clear()
+        board = naked_twins_board(board, solved, visit, dirty)
+    return False
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -141,71 +309,85 @@ def search(values):
     Finds the solution to Sudoku. It does it by repeated elminiation, until the Sudoku can no longer
     be reduced. Then it uses brute force search using recusing and depth-first-search (DFS)
     Input: A sudoku dictionary
-    Output: On success a sudoku dictionary; On failure, False or None.
+    Output: On success a sudoku dictionary; On failure, False.
+    """
+    board = search_board(values_to_board(values))
+    return board_to_values(board) if board else False
+
+def search_board(board, solved=None, dirty=None):
     """
-    # first, keep reducing the search space, using elimination, until the dictionary doesn't change any more
-    # then, if the game is solved, return the dictionary
-    # if the board is no longer searchable, i.e., 81 remaining numbers, return false
+    Same as search, but works on a board of bitmasks.
+    Input: A board, optionally a list of the boxes solved since the board was last reduced,
+        and optionally a set of the indexes of the units changed since then.
+    Output: On success a board; On failure, False.
+    """
+    # first, reduce the search space, using elimination, until the board doesn't change any more
+    # then, if the game is solved, return the board
+    # if the reduction runs into a contradiction, or a box has no values left, the board is a dead end, so return false
     # else find the box with the smallest length, like "87" has length of 2
     # then guess the "8" and try and recursively solve using DFS. if that doesn't work, try the "7" and solve
-    while True:
-        reduced = reduce_puzzle(values.copy())
-        if is_same(values, reduced): break
-        values = reduced
-
-    if is_solved(values):
-        return values
+    # the guesses are tried in the order given by order_guesses
+    board = reduce_board(board, solved, dirty)
 
-    if not is_searchable(values):
+    if not board or 0 in board:
         return False
 
-    box = find_smallest_box(values)
-    guesses = values[box]
+    if is_solved_board(board):
+        return board
+
+    # each guess gets its own copy of the board, except the last one, which can reuse this board
+    # since nothing looks at it after the last guess
+    box = find_smallest_box_board(board)
+    guesses = order_guesses(board, box)
+    last = guesses[-1]
     for guess in guesses:
-        values[box] = guess
-        result = search(values.copy())
+        child = board if guess == last else list(board)
+        child[box] = guess
+        result = search_board(child, [box], set(box_units[box]))
         if result:
             return result
+    return False
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
 
-def is_same(before, after):
+def is_solved(values):
     """
-    Checks whether two dictionaries are the same using a hash function.
-    Input: Two sudoku dictionaries.
+    Determines if the current board is a winner.
+    Input: A sudoku dictionary.
     Output: Boolean
     """
-    return hash(tuple(before.values())) == hash(tuple(after.values()))
-
-### ------------------------------------------------------------------------------------------- ###
-### ------------------------------------------------------------------------------------------- ###
-### ------------------------------------------------------------------------------------------- ###
+    return is_solved_board(values_to_board(values))
 
-def is_searchable(values):
+def is_solved_board(board):
     """
-    Determines if the sudoku board is still searchable.
-    Input: A sudoku dictionary.
+    Same as is_solved, but works on a board of bitmasks.
+    Input: A board.
     Output: Boolean
     """
-    return len(''.join(values.values())) > 81
+    # every box in a unit must hold a single value that no other box in the unit holds
+    # OR-ing those values together then has to give all nine digits
+    for unit in unit_idx:
+        unit_mask = 0
+        for i in unit:
+            mask = board[i]
+            if mask_len[mask] != 1 or mask & unit_mask: return False
+            unit_mask |= mask
+        if unit_mask != all_digits: return False
+    return True
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
 
-def is_solved(values):
+def find_solved_boxes(board):
     """
-    Determines if the current board is a winner.
-    Input: A sudoku dictionary.
-    Output: Boolean
+    Finds the boxes, or cells, that have only one value.
+    Input: A board.
+    Output: A list of ints, the indexes of the solved boxes.
     """
-    for unit in units:
-        unit_values_list = list(map(lambda box: values[box], unit))
-        unit_values_str = ''.join(sorted(''.join(unit_values_list)))
-        if unit_values_str != '123456789': return False
-    return True
+    return [i for i, mask in enumerate(board) if mask_len[mask] == 1]
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -217,7 +399,48 @@ def find_smallest_box(values):
     Input: A sudoku dictionary.
     Output: A string, representing the smallest box.
     """
-    return min(values, key=lambda box: 10 if len(values[box]) == 1 else len(values[box]))
+    i = find_smallest_box_board(values_to_board(values))
+    return None if i is None else boxes[i]
+
+def find_smallest_box_board(board):
+    """
+    Same as find_smallest_box, but works on a board of bitmasks.
+    Input: A board.
+    Output: An int, the index of the smallest box, or None if every box is solved.
+    """
+    # skip the solved boxes, and keep the unsolved box with the fewest values
+    # ties go to the box with the most peers, since a guess there constrains more of the board
+    # the boxes are visited in `degree_order`, most peers first, so the first box found wins any tie
+    # no unsolved box can have fewer than 2 values, so stop at the first 2-valued box
+    best, best_len = None, 10
+    for i in degree_order:
+        length = mask_len[board[i]]
+        if 1 < length < best_len:
+            best, best_len = i, length
+            if length == 2: return i
+    return best
+
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+### ------------------------------------------------------------------------------------------- ###
+
+def order_guesses(board, box):
+    """
+    Orders the values of a box so that the most constrained value comes first.
+    Input: A board, and the index of the box to guess.
+    Output: A list of bitmasks, one per value of the box.
+    """
+    # count, for each value, how many boxes in the box's units could still hold it
+    # a value with few places left is the most likely to fail fast, or to be right, so it is tried first
+    guesses = mask_bits[board[box]]
+    counts = dict.fromkeys(guesses, 0)
+    for u in box_units[box]:
+        for i in unit_idx[u]:
+            mask = board[i]
+            for guess in guesses:
+                if mask & guess:
+                    counts[guess] += 1
+    return sorted(guesses, key=counts.__getitem__)
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -232,8 +455,8 @@ def solve(grid):
     Returns:
         The dictionary representation of the final sudoku grid. False if no solution exists.
     """
-    values = grid_values(grid)
-    return search(values)
+    board = search_board(grid_board(grid))
+    return board_to_values(board) if board else False
 
 ### ------------------------------------------------------------------------------------------- ###
 ### ------------------------------------------------------------------------------------------- ###
@@ -242,15 +465,28 @@ def solve(grid):
 # begin globally defined variables
 rows = 'ABCDEFGHI'
 cols = '123456789'
-boxes = cross(rows, cols)
-row_units = [cross(row, cols) for row in rows]
-col_units = [cross(rows, col) for col in cols]
-square_units = [cross(xs, ys) for xs in ['ABC', 'DEF', 'GHI'] for ys in ['123', '456', '789']]
-diag_tuples = [(row + col, row + str(abs(c - 9))) for r, row in enumerate(rows) for c, col in enumerate(cols) if r == c]
-diag_units = [list(map(lambda t: t[0], diag_tuples)), list(map(lambda t: t[1], diag_tuples))]
+boxes = tuple(cross(rows, cols))
+row_units = tuple(tuple(cross(row, cols)) for row in rows)
+col_units = tuple(tuple(cross(rows, col)) for col in cols)
+square_units = tuple(tuple(cross(xs, ys)) for xs in ('ABC', 'DEF', 'GHI') for ys in ('123', '456', '789'))
+diag_tuples = tuple((row + col, row + str(abs(c - 9))) for r, row in enumerate(rows) for c, col in enumerate(cols) if r == c)
+diag_units = (tuple(t[0] for t in diag_tuples), tuple(t[1] for t in diag_tuples))
 units = row_units + col_units + square_units + diag_units
-boxdict = {box: [unit for unit in units if box in unit] for box in boxes}
-peers = {box: set(chain(*boxdict[box])) - set([box]) for box in boxes}
+boxdict = {box: tuple(unit for unit in units if box in unit) for box in boxes}
+peers = {box: tuple(peer for peer in dict.fromkeys(chain(*boxdict[box])) if peer != box) for box in boxes}
+all_digits = 0x1FF
+digit_bits = {digit: 1 << d for d, digit in enumerate(cols)}
+mask_len = tuple(bin(mask).count('1') for mask in range(all_digits + 1))
+mask_bits = tuple(tuple(1 << d for d in range(9) if mask >> d & 1) for mask in range(all_digits + 1))
+mask_digits = tuple(''.join(digit for digit in cols if mask & digit_bits[digit]) for mask in range(all_digits + 1))
+digits_mask = {digits: mask for mask, digits in enumerate(mask_digits)}
+twin_keep = {mask: all_digits & ~mask for mask in range(all_digits + 1) if mask_len[mask] == 2}
+box_index = {box: i for i, box in enumerate(boxes)}
+unit_idx = tuple(tuple(box_index[box] for box in unit) for unit in units)
+peer_idx = tuple(tuple(box_index[peer] for peer in peers[box]) for box in boxes)
+peer_count = tuple(len(peer_idx[i]) for i in range(len(boxes)))
+degree_order = tuple(sorted(range(len(boxes)), key=lambda i: -peer_count[i]))
+box_units = tuple(tuple(u for u, unit in enumerate(unit_idx) if i in unit) for i in range(len(boxes)))
 # end globally defined variables
 
 if __name__ == '__main__':
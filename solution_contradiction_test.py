@@ -0,0 +1,51 @@
+import solution
+import unittest
+
+
+def board_with_row_a(*row_a):
+    """Returns an empty sudoku dictionary, with the given values in the boxes of row A."""
+    values = solution.grid_values('.' * 81)
+    for box, value in zip(solution.row_units[0], row_a):
+        values[box] = value
+    return values
+
+
+class TestContradictions(unittest.TestCase):
+    diagonal_grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+
+    def test_eliminate_empty_box(self):
+        values = solution.grid_values('11' + '.' * 79)
+        self.assertIs(solution.eliminate(values), False)
+
+    def test_only_choice_missing_digit(self):
+        values = board_with_row_a(*['23456789'] * 9)
+        self.assertIs(solution.only_choice(values), False)
+
+    def test_only_choice_two_digits_one_box(self):
+        values = board_with_row_a('12', *['3456789'] * 8)
+        self.assertIs(solution.only_choice(values), False)
+
+    def test_only_choice_board_two_digits_one_box(self):
+        board = solution.values_to_board(board_with_row_a('12', *['3456789'] * 8))
+        self.assertIs(solution.only_choice_board(board, [], None, set()), False)
+
+    def test_naked_twins_three_boxes_one_pair(self):
+        values = board_with_row_a('12', '12', '12', *['3456789'] * 6)
+        self.assertIs(solution.naked_twins(values), False)
+
+    def test_naked_twins_empty_box(self):
+        values = board_with_row_a('12', '12', '1', *['3456789'] * 6)
+        self.assertIs(solution.naked_twins(values), False)
+
+    def test_reduce_puzzle_contradiction(self):
+        values = solution.grid_values('11' + '.' * 79)
+        self.assertIs(solution.reduce_puzzle(values), False)
+
+    def test_consistent_board(self):
+        for strategy in (solution.eliminate, solution.only_choice, solution.naked_twins, solution.reduce_puzzle):
+            values = solution.grid_values(self.diagonal_grid)
+            self.assertIsInstance(strategy(values), dict, strategy.__name__)
+
+
+if __name__ == '__main__':
+    unittest.main()